@@ -3,18 +3,25 @@ Note:  This script is disorganized, but it serves its purpose and there are no b
 """
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import datetime
-import json
-import re
-import requests
+from itertools import islice
+import os
+from zoneinfo import ZoneInfo
 
-import pytz
+from requests.adapters import HTTPAdapter
+import requests_cache
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 
 
 # To request data
 _URL_WU_API_BASE = 'http://api.wunderground.com/api/{key}/{feature}/q/{query}.json'
 _URL_MARINE_FORECAST = 'http://tgftp.nws.noaa.gov/data/raw/fz/fzak51.pafc.cwf.aer.txt'
-_SEPARATOR_MARINE_FORECAST = '\$\$'
+_SEPARATOR_MARINE_FORECAST = '$$'
 
 # To format API URLs for specific location
 _LATLONS = {'anchor_point': '59.7775,-151.7702',
@@ -44,6 +51,8 @@ _ORDER_CURRENT_TEMPERATURE = [
     ('cooper_landing', 'Cooper Landing'),
     ('anchorage', 'Anchorage')
 ]
+_CURRENT_TEMP_PADDING = max(len(city) for _, city in _ORDER_CURRENT_TEMPERATURE)
+_ORDER_TIDES = ['kachemak_bay_seldovia', 'kenai_river']
 _ORDER_FORECAST = [
     ('western_kenai_peninsula', 'Western Kenai Peninsula'),
     ('anchorage', 'Anchorage')
@@ -59,9 +68,34 @@ _ORDER_MARINE_FORECAST = [
 ]
 
 
+# To cache API responses between runs; current conditions only live as long as the script's minimum run interval
+_PATH_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.wx_cache')
+_EXPIRE_AFTER_DEFAULT = 1800
+_EXPIRE_AFTER_CONDITIONS = 120
+
+
+def _is_cacheable(response):
+    # Weather Underground reports errors (e.g., a bad key or rate limiting) in successful JSON responses, so fresh
+    # responses are checked for an error key; a byte search avoids parsing bodies that are parsed again on use
+    if getattr(response, 'from_cache', False) or not response.url.startswith(_URL_WU_API_BASE.partition('{')[0]):
+        return True
+    return b'"error"' not in response.content
+
+
+_SESSION = requests_cache.CachedSession(
+    _PATH_CACHE, backend='sqlite', expire_after=_EXPIRE_AFTER_DEFAULT,
+    urls_expire_after={'api.wunderground.com/api/*/conditions/': _EXPIRE_AFTER_CONDITIONS},
+    filter_fn=_is_cacheable)
+# To reuse connections across API calls, including those made from concurrent fetches
+_SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# To fetch API data concurrently, sharing one bounded pool across every report section
+_MAX_WORKERS = 8
+_EXECUTOR = ThreadPoolExecutor(max_workers=_MAX_WORKERS)
+
 # To convert datetimes
-_TIMEZONE_UTC = pytz.timezone('UTC')
-_TIMEZONE_AK = pytz.timezone('US/Alaska')
+# Uses the system tz database; install the tzdata package on platforms without one (e.g., Windows)
+_TIMEZONE_AK = ZoneInfo('America/Anchorage')
 
 # To access API data
 _KEY_SUNPHASE_LOCATION = 'kenai_river'
@@ -76,6 +110,14 @@ _FORECAST_PERIOD_INCLUSION = {
     'western_kenai_peninsula': [0, 1, 2],
     'anchorage': [1, 2]
 }
+# To format only the API URLs that each report uses
+_WU_API_QUERIES = {
+    'daily': [('astronomy', _KEY_SUNPHASE_LOCATION)] +
+             [('tide', key) for key in _ORDER_TIDES] +
+             [('forecast', key) for key, _ in _ORDER_FORECAST],
+    'current': [('conditions', key) for key, _ in _ORDER_CURRENT_TEMPERATURE],
+    'marine': []
+}
 
 # To output information
 _STRING_DAYLIGHT = """
@@ -94,19 +136,11 @@ Tides
 {kenai_river_detail}
 """
 
-_STRING_TIDES_DETAIL = """    {month:0>2d}/{day:0>2d}
-      High tide:  {high_hour}:{high_minute} ({high_height})
-      Low tide:   {low_hour}:{low_minute} ({low_height})
-"""
-
 _STRING_CURRENT_TEMPERATURE = """
 Current temperature
 {current_temperature_detail}
 """
 
-_STRING_CURRENT_TEMPERATURE_DETAIL = """  {city:<{padding}s}  {temperature:.0f}
-"""
-
 _STRING_FORECAST = """
 Forecast
   Western Kenai Peninsula
@@ -115,8 +149,16 @@ Forecast
 {anchorage_detail}
 """
 
-_STRING_FORECAST_DETAIL = """    {title}:  {forecast}
-"""
+def _fetch_concurrently(fetch, key_locations):
+    # Results keep the order of key_locations, so callers can zip them back together
+    return list(_EXECUTOR.map(fetch, key_locations))
+
+
+def _get_wu_api_urls(key, queries):
+    # URLs only depend on the key, feature, and location, so they are formatted once per run
+    return {(feature, key_location): _URL_WU_API_BASE.format(key=key, feature=feature, query=_LATLONS[key_location])
+            for feature, key_location in queries}
+
 
 def get_today_sunphase():
     sunrise_hour, sunrise_min, sunset_hour, sunset_min = _get_sun_phase_data_from_weather_underground()
@@ -137,8 +179,7 @@ def get_today_sunphase():
 
 
 def _get_sun_phase_data_from_weather_underground():
-    url = _URL_WU_API_BASE.format(key=_KEY, feature='astronomy', query=_LATLONS[_KEY_SUNPHASE_LOCATION])
-    data = json.loads(requests.get(url).text)
+    data = _json.loads(_SESSION.get(_URLS['astronomy', _KEY_SUNPHASE_LOCATION]).content)
     data_sunrise = data['sun_phase']['sunrise']
     sunrise_hour = int(data_sunrise['hour'])
     sunrise_min = int(data_sunrise['minute'])
@@ -149,20 +190,20 @@ def _get_sun_phase_data_from_weather_underground():
 
 
 def _get_today_datetime_in_alaska_tz():
-    datetime_utc = datetime.datetime.utcnow().replace(tzinfo=_TIMEZONE_UTC)
-    datetime_ak = datetime_utc.astimezone(_TIMEZONE_AK)
+    datetime_ak = datetime.datetime.now(_TIMEZONE_AK)
     return datetime_ak.year, datetime_ak.month, datetime_ak.day
 
 
 def get_tomorrow_sunphase_and_tides():
-    key_locations = ['kachemak_bay_seldovia', 'kenai_river']
+    raw_data_all_tides = _fetch_concurrently(_get_tide_data_from_weather_underground, _ORDER_TIDES)
+    date_tomorrow = _get_tomorrow_datetime_in_alaska_tz()
     tide_string_details = {}
-    for key_location in key_locations:
-        raw_data_tides = _get_tide_data_from_weather_underground(key_location)
-        if key_location == _KEY_SUNPHASE_LOCATION:
-            sunrise, sunset = _format_sunphase_data(raw_data_tides)
+    for key_location, raw_data_tides in zip(_ORDER_TIDES, raw_data_all_tides):
+        want_sun = key_location == _KEY_SUNPHASE_LOCATION
+        sunrise_location, sunset_location, data_tides = _parse_tide_summary(raw_data_tides, date_tomorrow, want_sun)
+        if want_sun:
+            sunrise, sunset = sunrise_location, sunset_location
             daylight_hours, daylight_minutes = _get_total_daylight_hours_and_minutes(sunset - sunrise)
-        data_tides = _format_tide_data(raw_data_tides)
         location_details = _format_tide_detail_strings(data_tides)
         tide_string_details[key_location + '_detail'] = location_details
     return _STRING_DAYLIGHT.format(
@@ -173,29 +214,46 @@ def get_tomorrow_sunphase_and_tides():
 
 
 def _get_tide_data_from_weather_underground(key_location):
-    url = _URL_WU_API_BASE.format(key=_KEY, feature='tide', query=_LATLONS[key_location])
-    return json.loads(requests.get(url).text)
+    return _json.loads(_SESSION.get(_URLS['tide', key_location]).content)
 
 
-def _format_sunphase_data(raw_data_tides):
+def _parse_tide_summary(raw_data_tides, date_tomorrow, want_sun):
+    # Sunphase and tide data come from the same summary, so both are extracted in a single pass
     sunrise_hour = 0
     sunrise_minute = 0
     sunset_hour = 0
     sunset_minute = 0
-    year, month, day = _get_tomorrow_datetime_in_alaska_tz()
+    data_tides = {}
+    tides_done = False
+    year, month, day = date_tomorrow
     for datum in raw_data_tides['tide']['tideSummary']:
         date = datum['date']
-        if (int(date['year']), int(date['mon']), int(date['mday'])) != (year, month, day):
-            continue
-        hour = int(date['hour'])
-        minute = int(date['min'])
-        if datum['data']['type'] == _KEY_SUNRISE:
-            sunrise_hour, sunrise_minute = (hour, minute)
-        if datum['data']['type'] == _KEY_SUNSET:
-            sunset_hour, sunset_minute = (hour, minute)
+        type_ = datum['data']['type']
+        if type_ in (_KEY_TIDE_HIGH, _KEY_TIDE_LOW):
+            if tides_done:
+                continue
+            if int(date['mday']) > day:
+                tides_done = True
+                if not want_sun:
+                    break
+                continue
+            date_key = (int(date['year']), int(date['mon']), int(date['mday']))
+            data_tides.setdefault(date_key, {})[type_] = \
+                {_KEY_HOUR: date['hour'],
+                 _KEY_MINUTE: date['min'],
+                 _KEY_TIDE_HEIGHT: datum['data']['height']}
+        elif want_sun and type_ in (_KEY_SUNRISE, _KEY_SUNSET):
+            if (int(date['year']), int(date['mon']), int(date['mday'])) != date_tomorrow:
+                continue
+            if type_ == _KEY_SUNRISE:
+                sunrise_hour, sunrise_minute = (int(date['hour']), int(date['min']))
+            else:
+                sunset_hour, sunset_minute = (int(date['hour']), int(date['min']))
+    if not want_sun:
+        return None, None, data_tides
     sunrise = datetime.datetime(year, month, day, sunrise_hour, sunrise_minute)
     sunset = datetime.datetime(year, month, day, sunset_hour, sunset_minute)
-    return sunrise, sunset
+    return sunrise, sunset, data_tides
 
 
 def _get_total_daylight_hours_and_minutes(datetime_delta):
@@ -205,107 +263,78 @@ def _get_total_daylight_hours_and_minutes(datetime_delta):
     return daylight_hours, daylight_minutes
 
 
-def _format_tide_data(raw_data_tides):
-    data_tides = {}
-    _, _, date_tomorrow = _get_tomorrow_datetime_in_alaska_tz()
-    for datum in raw_data_tides['tide']['tideSummary']:
-        if datum['data']['type'] not in [_KEY_TIDE_HIGH, _KEY_TIDE_LOW]:
-            continue
-        date = datum['date']
-        if int(date['mday']) > date_tomorrow:
-            break
-        datetime_ak = datetime.datetime(int(date['year']), int(date['mon']), int(date['mday']))
-        data_tides.setdefault(datetime_ak, {})[datum['data']['type']] = \
-            {_KEY_HOUR: date['hour'],
-             _KEY_MINUTE: date['min'],
-             _KEY_TIDE_HEIGHT: datum['data']['height']}
-    return data_tides
-
-
 def _get_tomorrow_datetime_in_alaska_tz():
-    datetime_utc = datetime.datetime.utcnow().replace(tzinfo=_TIMEZONE_UTC)
-    datetime_ak = datetime_utc.astimezone(_TIMEZONE_AK)
+    datetime_ak = datetime.datetime.now(_TIMEZONE_AK)
     datetime_tomorrow = datetime_ak + datetime.timedelta(days=1)
     return datetime_tomorrow.year, datetime_tomorrow.month, datetime_tomorrow.day
 
 
 def _format_tide_detail_strings(data_tides):
     tide_string_details = []
-    for datetime_ak, datum in sorted(data_tides.items(), key=lambda dt: dt[0]):
+    for (_, month, day), datum in sorted(data_tides.items()):
         tide_high = datum.get(_KEY_TIDE_HIGH, {})
         tide_low = datum.get(_KEY_TIDE_LOW, {})
         tide_string_details.append(
-            _STRING_TIDES_DETAIL.format(
-                month=datetime_ak.month,
-                day=datetime_ak.day,
-                high_hour=tide_high.get(_KEY_HOUR, 'XX'),
-                high_minute=tide_high.get(_KEY_MINUTE, 'XX'),
-                high_height=tide_high.get(_KEY_TIDE_HEIGHT, 'XX'),
-                low_hour=tide_low.get(_KEY_HOUR, 'XX'),
-                low_minute=tide_low.get(_KEY_MINUTE, 'XX'),
-                low_height=tide_low.get(_KEY_TIDE_HEIGHT, 'XX')
-                ))
+            f'    {month:0>2d}/{day:0>2d}\n'
+            f'      High tide:  {tide_high.get(_KEY_HOUR, "XX")}:{tide_high.get(_KEY_MINUTE, "XX")} '
+            f'({tide_high.get(_KEY_TIDE_HEIGHT, "XX")})\n'
+            f'      Low tide:   {tide_low.get(_KEY_HOUR, "XX")}:{tide_low.get(_KEY_MINUTE, "XX")} '
+            f'({tide_low.get(_KEY_TIDE_HEIGHT, "XX")})\n'
+            )
     return ''.join(tide_string_details)
 
 
 def get_current_temperature():
-    string_padding = max(len(city) for _, city in _ORDER_CURRENT_TEMPERATURE)
+    keys = [key for key, _ in _ORDER_CURRENT_TEMPERATURE]
+    raw_temps = _fetch_concurrently(_get_current_temperature_data_from_weather_underground, keys)
     string_temperature_details = []
-    for key, city in _ORDER_CURRENT_TEMPERATURE:
-        raw_temp = _get_current_temperature_data_from_weather_underground(key)
-        city_detail = _STRING_CURRENT_TEMPERATURE_DETAIL.format(
-            city=city + ':', padding=string_padding, temperature=raw_temp)
-        string_temperature_details.append(city_detail)
+    for (_, city), raw_temp in zip(_ORDER_CURRENT_TEMPERATURE, raw_temps):
+        string_temperature_details.append(f'  {city + ":":<{_CURRENT_TEMP_PADDING}s}  {raw_temp:.0f}\n')
     return _STRING_CURRENT_TEMPERATURE.format(current_temperature_detail=''.join(string_temperature_details))
 
 
 def _get_current_temperature_data_from_weather_underground(key_location):
-    url = _URL_WU_API_BASE.format(key=_KEY, feature='conditions', query=_LATLONS[key_location])
-    return json.loads(requests.get(url).text)['current_observation']['temp_f']
+    return _json.loads(_SESSION.get(_URLS['conditions', key_location]).content)['current_observation']['temp_f']
 
 
 def get_forecast():
+    keys = [key for key, _ in _ORDER_FORECAST]
+    raw_data_forecasts = _fetch_concurrently(_get_forecast_data_from_weather_underground, keys)
     location_details = {}
-    for key, name in _ORDER_FORECAST:
-        raw_data_forecast = _get_forecast_data_from_weather_underground(key)
+    for key, raw_data_forecast in zip(keys, raw_data_forecasts):
         data_forecast = _format_forecast_data(raw_data_forecast, _FORECAST_PERIOD_INCLUSION[key])
         location_details[key + '_detail'] = ''.join(
-            _STRING_FORECAST_DETAIL.format(title=title, forecast=forecast)
+            f'    {title}:  {forecast}\n'
             for title, forecast in data_forecast)
     return _STRING_FORECAST.format(**location_details)
 
 
 def _get_forecast_data_from_weather_underground(key_location):
-    url = _URL_WU_API_BASE.format(key=_KEY, feature='forecast', query=_LATLONS[key_location])
-    return json.loads(requests.get(url).text)
+    return _json.loads(_SESSION.get(_URLS['forecast', key_location]).content)
 
 
 def _format_forecast_data(raw_data_forecast, include_periods):
-    data_forecast = []
-    for datum in raw_data_forecast['forecast']['txt_forecast']['forecastday']:
-        if datum['period'] not in include_periods:
-            continue
-        data_forecast.append((datum['title'], datum['fcttext']))
-    return data_forecast
+    # Periods are numbered sequentially from 0, so nothing past the last included period needs to be read
+    forecastday = raw_data_forecast['forecast']['txt_forecast']['forecastday']
+    return [(datum['title'], datum['fcttext']) for datum in islice(forecastday, max(include_periods) + 1)
+            if datum['period'] in include_periods]
 
 
 def get_marine_forecast():
-    # Get and split the raw text into forecasts for individual locations
-    raw_text = requests.get(_URL_MARINE_FORECAST).text
-    split_text = re.split(_SEPARATOR_MARINE_FORECAST, raw_text)
-    # Sort forecasts for select locations
-    ordered_forecasts = []
-    for location in _ORDER_MARINE_FORECAST:
-        idx_found = [bool(re.search(location, forecast))
-                     for forecast in split_text].index(True)
-        ordered_forecasts.append(split_text[idx_found])
+    # Get and split the raw text into forecasts for individual locations, revalidating the cached copy with a
+    # conditional request (ETag/Last-Modified) so that an unchanged file comes back as a bodiless 304
+    raw_text = _SESSION.get(_URL_MARINE_FORECAST, refresh=True).content.decode('latin-1')
+    split_text = raw_text.split(_SEPARATOR_MARINE_FORECAST)
+    # Sort forecasts for select locations, using the first forecast that mentions each location
+    ordered_forecasts = [next(forecast for forecast in split_text if location in forecast)
+                         for location in _ORDER_MARINE_FORECAST]
     # Remove extra forecasts
     clean_forecasts = []
     for forecast in ordered_forecasts:
-        split_forecast = re.split('\n', forecast)
+        split_forecast = forecast.split('\n')
         # Remove leading newlines and codes
         for _ in range(3):
-            if split_forecast[0] == '' or re.search('PKZ', split_forecast[0]):
+            if split_forecast[0] == '' or 'PKZ' in split_forecast[0]:
                 split_forecast.pop(0)
         # Remove trailing newlines
         for _ in range(2):
@@ -315,7 +344,7 @@ def get_marine_forecast():
         for idx in reversed(range(len(split_forecast))):
             if split_forecast[idx] == '':  # Stop after reaching the first newline, separating forecasts from summary
                 break
-            if re.search('^\.', split_forecast[idx]) is None:  # Forecasts start with periods, e.g., ".SAT..."
+            if not split_forecast[idx].startswith('.'):  # Forecasts start with periods, e.g., ".SAT..."
                 split_forecast[idx-1] += ' ' + split_forecast[idx]
                 split_forecast.pop(idx)
         # Remove extra forecasts
@@ -331,12 +360,19 @@ if __name__ == '__main__':
     parser.add_argument('key', metavar='wu_key', type=str)
     parser.add_argument('type', metavar='weather_type', type=str, choices=['daily', 'current', 'marine'],
                         help='either "daily", "current", or "marine"')
-    _KEY = parser.parse_args().key
+    parser.add_argument('--force-refresh', action='store_true', help='ignore previously cached responses')
     type_ = parser.parse_args().type
+    _URLS = _get_wu_api_urls(parser.parse_args().key, _WU_API_QUERIES[type_])
+    if parser.parse_args().force_refresh:
+        _SESSION.cache.clear()
     print('IMPORTANT:  DO NOT USE THIS SCRIPT MORE THAN ONCE EVERY TWO MINUTES')
     output = ''
     if type_ == 'daily':
-        output = get_today_sunphase() + get_tomorrow_sunphase_and_tides() + get_forecast()
+        # Sections use disjoint API calls, so they are fetched concurrently and joined in their usual order
+        sections = [get_today_sunphase, get_tomorrow_sunphase_and_tides, get_forecast]
+        with ThreadPoolExecutor(max_workers=len(sections)) as executor:
+            futures = [executor.submit(section) for section in sections]
+            output = ''.join(future.result() for future in futures)
     elif type_ == 'current':
         output = get_current_temperature()
     elif type_ == 'marine':